@@ -1,24 +1,86 @@
-import re
+import asyncio
+import functools
+import hashlib
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from threading import RLock
 from typing import Optional, List, Dict
 from urllib.parse import urljoin, urlparse
 
-import requests
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Request
-from fastapi.responses import FileResponse, HTMLResponse
+import httpx
+from cachetools import TTLCache
+import lxml.html
+from lxml import etree
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, HTMLResponse, Response
 from pydantic import BaseModel, HttpUrl
 
 from app.scraper import WebScraper
-from app.processor import ImageEnhancer, ImageOptimizer
-from app.processor.screenshot import WebsiteScreenshotter
+from app.processor import EnhancementCache, ImageEnhancer, ImageOptimizer
+from app.processor.screenshot import WebsiteScreenshotter, clear_data_uri_cache
 from app.config import TEMP_DIR, OUTPUT_DIR
 
 router = APIRouter()
 
-# In-memory storage for POC (would use a database in production)
-scan_results: Dict[str, List[dict]] = {}
-scan_urls: Dict[str, str] = {}  # scan_id -> original URL
-job_status: Dict[str, dict] = {}
+# In-memory storage for POC (would use a database in production). TTL-capped
+# so the process can't grow without bound after hours of traffic, and guarded
+# by a lock since worker threads mutate job state while the event loop reads.
+_STORE_TTL = 3600
+
+scan_results = TTLCache(maxsize=1_000, ttl=_STORE_TTL)  # scan_id -> list of image records
+scan_urls = TTLCache(maxsize=1_000, ttl=_STORE_TTL)  # scan_id -> original URL
+image_index = TTLCache(maxsize=10_000, ttl=_STORE_TTL)  # image_id -> image record
+job_status = TTLCache(maxsize=10_000, ttl=_STORE_TTL)  # job_id -> status dict
+
+_store_lock = RLock()
+
+# image_id -> path of the optimized output. Kept in memory so the hot
+# preview/screenshot paths don't stat() four candidate extensions per image.
+enhanced_paths: Dict[str, Path] = {}
+
+
+def _rebuild_enhanced_index():
+    """Repopulate enhanced_paths from disk (e.g. after a restart)."""
+    for f in OUTPUT_DIR.iterdir():
+        if f.is_file() and f.name.startswith("enhanced_"):
+            enhanced_paths[f.stem[len("enhanced_"):]] = f
+
+
+_rebuild_enhanced_index()
+
+# Attributes rewritten by the preview proxy. Enhanced-image substitution
+# applies to all of them; relative-URL absolutization only to src/href,
+# matching the old regex behaviour.
+_REWRITE_ATTRS = ('src', 'data-src', 'data-lazy-src', 'srcset', 'href')
+_SRC_ATTRS = ('src', 'data-src', 'data-lazy-src')
+
+# Bounded worker pool for enhancement jobs. Jobs queue cheaply and at most
+# ENHANCE_WORKER_COUNT run at once, so a large batch can't flood the thread
+# pool or hammer Replicate's rate limits (each 429 costs a long backoff).
+ENHANCE_WORKER_COUNT = 4
+REPLICATE_CONCURRENCY = 4
+
+enhance_queue: asyncio.Queue = asyncio.Queue()
+_replicate_semaphore = asyncio.Semaphore(REPLICATE_CONCURRENCY)
+
+
+async def _enhancement_worker():
+    """Long-lived consumer that drains the enhancement queue."""
+    while True:
+        job_id, image_path, image_id, scale = await enhance_queue.get()
+        try:
+            async with _replicate_semaphore:
+                await process_enhancement(job_id, image_path, image_id, scale)
+        finally:
+            enhance_queue.task_done()
+
+
+def start_enhancement_workers():
+    """Start the worker tasks. Called from the app startup hook."""
+    for _ in range(ENHANCE_WORKER_COUNT):
+        asyncio.create_task(_enhancement_worker())
 
 
 class ScanRequest(BaseModel):
@@ -62,14 +124,12 @@ async def scan_url(request: ScanRequest):
         # Download all images
         downloaded = scraper.download_all()
 
-        # Generate scan ID
-        scan_id = f"scan_{hash(url) % 100000:05d}"
+        # Generate scan ID. Deterministic and effectively collision-free,
+        # unlike hash(url) % 100000 which collides (and silently overwrites
+        # prior scans) after a few hundred URLs.
+        scan_id = "scan_" + hashlib.blake2b(url.encode(), digest_size=6).hexdigest()
 
-        # Store URL for later screenshot use
-        scan_urls[scan_id] = url
-
-        # Store results
-        scan_results[scan_id] = [
+        records = [
             {
                 "id": img.id,
                 "original_url": img.original_url,
@@ -83,11 +143,17 @@ async def scan_url(request: ScanRequest):
             for img in downloaded
         ]
 
+        # Store URL (for later screenshot use) and results
+        with _store_lock:
+            scan_urls[scan_id] = url
+            scan_results[scan_id] = records
+            image_index.update({r["id"]: r for r in records})
+
         return ScanResponse(
             scan_id=scan_id,
             url=url,
             image_count=len(downloaded),
-            images=scan_results[scan_id]
+            images=records
         )
 
     except Exception as e:
@@ -97,56 +163,97 @@ async def scan_url(request: ScanRequest):
 @router.get("/scan/{scan_id}")
 async def get_scan_results(scan_id: str):
     """Get results of a previous scan."""
-    if scan_id not in scan_results:
+    with _store_lock:
+        images = scan_results.get(scan_id)
+
+    if images is None:
         raise HTTPException(status_code=404, detail="Scan not found")
 
-    return {"scan_id": scan_id, "images": scan_results[scan_id]}
+    return {"scan_id": scan_id, "images": images}
+
+
+@functools.lru_cache(maxsize=1)
+def _get_enhancer() -> ImageEnhancer:
+    """Shared enhancer so the Replicate/OpenAI client is built once, not per job."""
+    return ImageEnhancer()
+
+
+@functools.lru_cache(maxsize=1)
+def _get_optimizer() -> ImageOptimizer:
+    return ImageOptimizer()
 
 
-def process_enhancement(job_id: str, image_path: Path, image_id: str, scale: int):
-    """Background task to enhance a single image."""
+@functools.lru_cache(maxsize=1)
+def _get_enhancement_cache() -> EnhancementCache:
+    return EnhancementCache()
+
+
+async def process_enhancement(job_id: str, image_path: Path, image_id: str, scale: int):
+    """Worker coroutine to enhance a single image."""
     try:
-        job_status[job_id] = {"status": "processing", "image_id": image_id}
-
-        # Enhance with Real-ESRGAN
-        enhancer = ImageEnhancer()
-        enhanced_data = enhancer.enhance(image_path, scale=scale)
-
-        # Optimize the enhanced image
-        optimizer = ImageOptimizer()
-        result = optimizer.optimize_bytes(enhanced_data, f"enhanced_{image_id}")
-
-        job_status[job_id] = {
-            "status": "completed",
-            "image_id": image_id,
-            "output_path": str(result.output_path),
-            "original_size": result.original_size,
-            "optimized_size": result.optimized_size,
-            "size_reduction": f"{result.size_reduction_percent:.1f}%"
-        }
+        with _store_lock:
+            job_status[job_id] = {"status": "processing", "image_id": image_id}
+            record = image_index.get(image_id)
+        original_url = record.get("original_url") if record else None
+
+        # The persistent cache short-circuits repeat runs over the same
+        # site: same URL + scale means the billed API call can be skipped.
+        if original_url:
+            cached_path = await asyncio.to_thread(
+                _get_enhancement_cache().get, original_url, scale
+            )
+            if cached_path is not None:
+                enhanced_paths[image_id] = cached_path
+                with _store_lock:
+                    job_status[job_id] = {
+                        "status": "completed",
+                        "image_id": image_id,
+                        "output_path": str(cached_path),
+                        "cached": True
+                    }
+                return
+
+        # Enhance with Real-ESRGAN. The async path lets concurrent jobs
+        # overlap their upload/poll/download waits on the event loop.
+        enhanced_stream = await _get_enhancer().enhance_async(image_path, scale=scale)
+
+        # Optimize the enhanced image straight from the stream; the encode
+        # is CPU-bound, so it runs in a thread.
+        result = await asyncio.to_thread(
+            _get_optimizer().optimize_stream, enhanced_stream, f"enhanced_{image_id}"
+        )
+        enhanced_paths[image_id] = result.output_path
+        if original_url:
+            await asyncio.to_thread(
+                _get_enhancement_cache().put, original_url, scale, result.output_path
+            )
+
+        with _store_lock:
+            job_status[job_id] = {
+                "status": "completed",
+                "image_id": image_id,
+                "output_path": str(result.output_path),
+                "original_size": result.original_size,
+                "optimized_size": result.optimized_size,
+                "size_reduction": f"{result.size_reduction_percent:.1f}%"
+            }
 
     except Exception as e:
-        job_status[job_id] = {
-            "status": "failed",
-            "image_id": image_id,
-            "error": str(e)
-        }
+        with _store_lock:
+            job_status[job_id] = {
+                "status": "failed",
+                "image_id": image_id,
+                "error": str(e)
+            }
 
 
 @router.post("/enhance", response_model=EnhanceResponse)
-async def enhance_image(request: EnhanceRequest, background_tasks: BackgroundTasks):
+async def enhance_image(request: EnhanceRequest):
     """Enhance a single image by ID."""
     image_id = request.image_id
 
-    # Find the image in scan results
-    image_data = None
-    for scan_images in scan_results.values():
-        for img in scan_images:
-            if img["id"] == image_id:
-                image_data = img
-                break
-        if image_data:
-            break
+    with _store_lock:
+        image_data = image_index.get(image_id)
 
     if not image_data or not image_data.get("local_path"):
         raise HTTPException(status_code=404, detail="Image not found or not downloaded")
@@ -154,36 +261,40 @@ async def enhance_image(request: EnhanceRequest, background_tasks: BackgroundTas
     job_id = f"job_{image_id}"
     image_path = Path(image_data["local_path"])
 
-    # Start background processing
-    background_tasks.add_task(process_enhancement, job_id, image_path, image_id, request.scale)
+    # Queue for the worker pool
+    with _store_lock:
+        job_status[job_id] = {"status": "queued", "image_id": image_id}
+    await enhance_queue.put((job_id, image_path, image_id, request.scale))
 
     return EnhanceResponse(
         image_id=image_id,
-        status="processing"
+        status="queued"
     )
 
 
 @router.post("/enhance-batch")
-async def enhance_batch(request: EnhanceBatchRequest, background_tasks: BackgroundTasks):
+async def enhance_batch(request: EnhanceBatchRequest):
     """Enhance all images from a scan."""
-    if request.scan_id not in scan_results:
+    with _store_lock:
+        images = scan_results.get(request.scan_id)
+
+    if images is None:
         raise HTTPException(status_code=404, detail="Scan not found")
 
-    images = scan_results[request.scan_id]
     jobs = []
 
     for img in images:
         if img.get("local_path"):
             job_id = f"job_{img['id']}"
             image_path = Path(img["local_path"])
-            background_tasks.add_task(
-                process_enhancement, job_id, image_path, img["id"], request.scale
-            )
+            with _store_lock:
+                job_status[job_id] = {"status": "queued", "image_id": img["id"]}
+            await enhance_queue.put((job_id, image_path, img["id"], request.scale))
             jobs.append({"job_id": job_id, "image_id": img["id"]})
 
     return {
         "scan_id": request.scan_id,
-        "jobs_started": len(jobs),
+        "jobs_queued": len(jobs),
         "jobs": jobs
     }
 
@@ -191,24 +302,26 @@ async def enhance_batch(request: EnhanceBatchRequest, background_tasks: Backgrou
 @router.get("/status/{job_id}")
 async def get_job_status(job_id: str):
     """Check the status of an enhancement job."""
-    if job_id not in job_status:
+    with _store_lock:
+        status = job_status.get(job_id)
+
+    if status is None:
         return {"job_id": job_id, "status": "pending"}
 
-    return {"job_id": job_id, **job_status[job_id]}
+    return {"job_id": job_id, **status}
 
 
 @router.get("/results")
 async def get_results():
     """List all enhanced images."""
-    output_files = list(OUTPUT_DIR.glob("enhanced_*.*"))
-
-    results = []
-    for f in output_files:
-        results.append({
-            "filename": f.name,
-            "path": str(f),
-            "size": f.stat().st_size
-        })
+    # scandir's DirEntry.stat() is served from the directory listing where
+    # possible, avoiding a separate stat syscall per file.
+    with os.scandir(OUTPUT_DIR) as entries:
+        results = [
+            {"filename": e.name, "path": e.path, "size": e.stat().st_size}
+            for e in entries
+            if e.is_file() and e.name.startswith("enhanced_")
+        ]
 
     return {"count": len(results), "files": results}
 
@@ -216,51 +329,69 @@ async def get_results():
 @router.get("/enhanced/{image_id}")
 async def get_enhanced_image(image_id: str):
     """Serve an enhanced image by ID."""
-    # Look for the enhanced image in output directory
-    for ext in ['.png', '.webp', '.jpg', '.jpeg']:
-        image_path = OUTPUT_DIR / f"enhanced_{image_id}{ext}"
-        if image_path.exists():
-            return FileResponse(
-                path=str(image_path),
-                media_type=f"image/{ext[1:]}",
-                filename=f"enhanced_{image_id}{ext}"
+    image_path = enhanced_paths.get(image_id)
+
+    if image_path is None:
+        # Fall back to one directory scan instead of four exists() probes
+        image_path = next(OUTPUT_DIR.glob(f"enhanced_{image_id}.*"), None)
+        if image_path is not None:
+            enhanced_paths[image_id] = image_path
+
+    if image_path is None or not image_path.exists():
+        raise HTTPException(status_code=404, detail="Enhanced image not found")
+
+    return FileResponse(
+        path=str(image_path),
+        media_type=f"image/{image_path.suffix.lstrip('.')}",
+        filename=image_path.name
+    )
+
+
+def _clear_directories(directories: List[Path]):
+    """Delete all regular files directly inside the given directories."""
+    paths = []
+    for directory in directories:
+        if not directory.exists():
+            continue
+        with os.scandir(directory) as entries:
+            # Dot-files are bookkeeping (e.g. the enhancement cache db),
+            # cleared through their own APIs rather than unlinked here.
+            paths.extend(
+                e.path for e in entries
+                if e.is_file() and not e.name.startswith(".")
             )
 
-    raise HTTPException(status_code=404, detail="Enhanced image not found")
+    if paths:
+        # Thousands of serial unlink syscalls add up; fan out to a pool.
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            list(pool.map(os.unlink, paths))
 
 
 @router.delete("/clear")
 async def clear_data():
     """Clear all temporary and output files."""
-    import shutil
-
-    # Clear temp directory
-    for f in TEMP_DIR.glob("*"):
-        if f.is_file():
-            f.unlink()
-
-    # Clear output directory
-    for f in OUTPUT_DIR.glob("*"):
-        if f.is_file():
-            f.unlink()
-
-    # Clear screenshots directory
-    screenshots_dir = OUTPUT_DIR / "screenshots"
-    if screenshots_dir.exists():
-        for f in screenshots_dir.glob("*"):
-            if f.is_file():
-                f.unlink()
+    await asyncio.to_thread(
+        _clear_directories,
+        [TEMP_DIR, OUTPUT_DIR, OUTPUT_DIR / "screenshots"]
+    )
 
     # Clear in-memory data
-    scan_results.clear()
-    scan_urls.clear()
-    job_status.clear()
+    with _store_lock:
+        scan_results.clear()
+        scan_urls.clear()
+        image_index.clear()
+        job_status.clear()
+    enhanced_paths.clear()
+    _scan_replacements.clear()
+    _preview_cache.clear()
+    _get_enhancement_cache().clear()
+    clear_data_uri_cache()
 
     return {"status": "cleared"}
 
 
 @router.post("/screenshots/{scan_id}")
-async def capture_screenshots(scan_id: str, background_tasks: BackgroundTasks):
+async def capture_screenshots(scan_id: str):
     """Capture before/after full-page screenshots of the website."""
     if scan_id not in scan_urls:
         raise HTTPException(status_code=404, detail="Scan not found")
@@ -271,15 +402,9 @@ async def capture_screenshots(scan_id: str, background_tasks: BackgroundTasks):
     image_replacements = {}
     if scan_id in scan_results:
         for img in scan_results[scan_id]:
-            original_url = img["original_url"]
-            image_id = img["id"]
-
-            # Find enhanced image path
-            for ext in ['.webp', '.png', '.jpg', '.jpeg']:
-                enhanced_path = OUTPUT_DIR / f"enhanced_{image_id}{ext}"
-                if enhanced_path.exists():
-                    image_replacements[original_url] = str(enhanced_path)
-                    break
+            enhanced_path = enhanced_paths.get(img["id"])
+            if enhanced_path:
+                image_replacements[img["original_url"]] = str(enhanced_path)
 
     # Capture screenshots
     screenshotter = WebsiteScreenshotter()
@@ -322,6 +447,151 @@ async def get_screenshot(scan_id: str, view_type: str):
     )
 
 
+def _enhanced_fingerprint(scan_id: str) -> str:
+    """Hash over the scan's enhanced image ids; changes when new outputs land."""
+    with _store_lock:
+        ids = sorted(
+            img["id"] for img in scan_results.get(scan_id, [])
+            if img["id"] in enhanced_paths
+        )
+    return hashlib.blake2b("|".join(ids).encode(), digest_size=8).hexdigest()
+
+
+# scan_id -> (fingerprint, server_base, url_map, fn_map)
+_scan_replacements: Dict[str, tuple] = {}
+
+
+def _replacement_table(scan_id: str, server_base: str, fingerprint: str) -> tuple:
+    """
+    Build (or reuse) the URL-replacement lookup tables for a scan.
+
+    Rebuilding happens only when the enhanced state changes, so repeated
+    preview hits reuse the same lookup dicts.
+    """
+    cached = _scan_replacements.get(scan_id)
+    if cached and cached[0] == fingerprint and cached[1] == server_base:
+        return cached[2:]
+
+    # Every URL form we might encounter in an attribute value, plus a
+    # filename-only table for lazy-loaded images.
+    url_to_enhanced: Dict[str, str] = {}
+    filename_to_enhanced: Dict[str, str] = {}
+
+    with _store_lock:
+        records = list(scan_results.get(scan_id, []))
+
+    for img in records:
+        original_url = img["original_url"]
+        image_id = img["id"]
+
+        if image_id not in enhanced_paths:
+            continue
+
+        # Use absolute URL to ensure it loads in iframe
+        enhanced_url = f"{server_base}/api/enhanced/{image_id}"
+
+        # Full absolute URL, path only, and path with query string
+        url_to_enhanced[original_url] = enhanced_url
+        parsed_img = urlparse(original_url)
+        img_path = parsed_img.path
+        if img_path:
+            url_to_enhanced[img_path] = enhanced_url
+            if parsed_img.query:
+                url_to_enhanced[f"{img_path}?{parsed_img.query}"] = enhanced_url
+
+        # Filename only (for lazy-loaded images)
+        filename = Path(img_path).name if img_path else ""
+        if filename and len(filename) > 3:
+            filename_to_enhanced[filename] = enhanced_url
+
+    _scan_replacements[scan_id] = (
+        fingerprint, server_base, url_to_enhanced, filename_to_enhanced
+    )
+    return _scan_replacements[scan_id][2:]
+
+
+# Rendered previews, keyed on (scan_id, view_type, server_base, fingerprint).
+# A plain bounded dict because the renderer is async (lru_cache would cache
+# the coroutine, not the result).
+_PREVIEW_CACHE_MAX = 64
+_preview_cache: OrderedDict = OrderedDict()
+
+
+async def _render_preview(
+    client: httpx.AsyncClient, scan_id: str, view_type: str, server_base: str, fingerprint: str
+) -> str:
+    """
+    Fetch the scanned site and rewrite its HTML for the preview iframe.
+
+    The rewrites are deterministic per (scan_id, view_type, enhanced state),
+    so results are cached; `fingerprint` keys the cache on the enhanced
+    state and invalidates entries when new outputs land.
+    """
+    cache_key = (scan_id, view_type, server_base, fingerprint)
+    cached = _preview_cache.get(cache_key)
+    if cached is not None:
+        _preview_cache.move_to_end(cache_key)
+        return cached
+
+    url = scan_urls[scan_id]
+    parsed_url = urlparse(url)
+    base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
+
+    # Fetch the original website cooperatively; a blocking requests.get here
+    # pinned an event-loop thread for up to 30s per slow upstream.
+    response = await client.get(url)
+    response.raise_for_status()
+
+    # Parse once and mutate attributes in a single traversal, instead of
+    # several full-string regex scans. This also avoids mis-rewriting URL
+    # lookalikes inside <script> bodies or inline JSON. Parsing the raw
+    # bytes lets lxml honor a declared encoding; feeding it decoded text
+    # raises on pages with an XML prolog.
+    tree = lxml.html.fromstring(response.content)
+
+    url_to_enhanced: Dict[str, str] = {}
+    filename_to_enhanced: Dict[str, str] = {}
+    if view_type == "after" and scan_id in scan_results:
+        url_to_enhanced, filename_to_enhanced = \
+            _replacement_table(scan_id, server_base, fingerprint)
+
+    for node in tree.iter(etree.Element):
+        for attr in _REWRITE_ATTRS:
+            val = node.get(attr)
+            if not val:
+                continue
+
+            # Enhanced-image substitution first, then URL absolutization
+            enhanced = url_to_enhanced.get(val)
+            if enhanced is None and filename_to_enhanced and attr in _SRC_ATTRS:
+                filename = Path(urlparse(val).path).name
+                enhanced = filename_to_enhanced.get(filename)
+
+            if enhanced is not None:
+                node.set(attr, enhanced)
+            elif attr in ('src', 'href'):
+                if val.startswith('//'):
+                    node.set(attr, f'https:{val}')
+                elif not val.startswith('http') and not val.startswith('/api/'):
+                    node.set(attr, urljoin(url, val))
+
+    # Add base tag and some CSS fixes
+    head = tree.find('.//head')
+    if head is not None:
+        style_el = tree.makeelement('style', {})
+        style_el.text = 'img { max-width: 100%; height: auto; }'
+        head.insert(0, style_el)
+        head.insert(0, tree.makeelement('base', {'href': base_url}))
+
+    html = '<!DOCTYPE html>\n' + lxml.html.tostring(tree, encoding='unicode')
+
+    _preview_cache[cache_key] = html
+    if len(_preview_cache) > _PREVIEW_CACHE_MAX:
+        _preview_cache.popitem(last=False)
+
+    return html
+
+
 @router.get("/preview/{scan_id}/{view_type}")
 async def preview_website(scan_id: str, view_type: str, request: Request):
     """
@@ -334,95 +604,31 @@ async def preview_website(scan_id: str, view_type: str, request: Request):
     if scan_id not in scan_urls:
         raise HTTPException(status_code=404, detail="Scan not found")
 
-    url = scan_urls[scan_id]
-    parsed_url = urlparse(url)
-    base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
+    fingerprint = _enhanced_fingerprint(scan_id)
+    etag = f'"{scan_id}-{view_type}-{fingerprint}"'
 
-    try:
-        # Fetch the original website
-        response = requests.get(url, timeout=30, headers={
-            "User-Agent": "Mozilla/5.0 (compatible; AutoCrisp/1.0)"
-        })
-        response.raise_for_status()
-        html = response.text
-
-        # For 'after' view, replace image URLs with enhanced versions BEFORE rewriting URLs
-        if view_type == "after" and scan_id in scan_results:
-            images = scan_results[scan_id]
-            for img in images:
-                original_url = img["original_url"]
-                image_id = img["id"]
-
-                # Check if enhanced image exists
-                enhanced_exists = False
-                for ext in ['.webp', '.png', '.jpg', '.jpeg']:
-                    if (OUTPUT_DIR / f"enhanced_{image_id}{ext}").exists():
-                        enhanced_exists = True
-                        break
-
-                if enhanced_exists:
-                    # Use absolute URL to ensure it loads in iframe
-                    server_base = f"{request.url.scheme}://{request.url.netloc}"
-                    enhanced_url = f"{server_base}/api/enhanced/{image_id}"
-
-                    # Try multiple URL formats for replacement
-                    # 1. Full absolute URL
-                    html = html.replace(f'"{original_url}"', f'"{enhanced_url}"')
-                    html = html.replace(f"'{original_url}'", f"'{enhanced_url}'")
-
-                    # 2. Extract path from URL and try that
-                    parsed_img = urlparse(original_url)
-                    img_path = parsed_img.path
-                    if img_path:
-                        html = html.replace(f'"{img_path}"', f'"{enhanced_url}"')
-                        html = html.replace(f"'{img_path}'", f"'{enhanced_url}'")
-
-                    # 3. Try with query string
-                    if parsed_img.query:
-                        full_path = f"{img_path}?{parsed_img.query}"
-                        html = html.replace(f'"{full_path}"', f'"{enhanced_url}"')
-                        html = html.replace(f"'{full_path}'", f"'{enhanced_url}'")
-
-                    # 4. Try filename only (for lazy-loaded images)
-                    filename = Path(img_path).name if img_path else ""
-                    if filename and len(filename) > 3:
-                        # Use regex to replace src/data-src containing this filename
-                        pattern = rf'(src|data-src|data-lazy-src)=(["\'])[^"\']*{re.escape(filename)}[^"\']*\2'
-                        html = re.sub(pattern, f'\\1=\\2{enhanced_url}\\2', html)
-
-        # Rewrite relative URLs to absolute (after image replacement)
-        html = re.sub(
-            r'(href|src)=["\'](?!//)(?!http)(?!/api/)([^"\']+)["\']',
-            lambda m: f'{m.group(1)}="{urljoin(url, m.group(2))}"',
-            html
-        )
+    # Let iframe reloads revalidate instead of re-rendering and re-sending
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304)
 
-        # Rewrite protocol-relative URLs
-        html = re.sub(
-            r'(href|src)=["\'](//[^"\']+)["\']',
-            lambda m: f'{m.group(1)}="https:{m.group(2)}"',
-            html
-        )
+    server_base = f"{request.url.scheme}://{request.url.netloc}"
 
-        # Add base tag and some CSS fixes
-        inject_head = f'''
-        <base href="{base_url}">
-        <style>
-            /* Prevent layout shifts */
-            img {{ max-width: 100%; height: auto; }}
-        </style>
-        '''
-
-        # Insert after <head>
-        html = re.sub(r'(<head[^>]*>)', r'\1' + inject_head, html, flags=re.IGNORECASE)
-
-        return HTMLResponse(
-            content=html,
-            headers={
-                "X-Frame-Options": "SAMEORIGIN",
-                "Content-Security-Policy": "frame-ancestors 'self'"
-            }
+    try:
+        html = await _render_preview(
+            request.app.state.http, scan_id, view_type, server_base, fingerprint
         )
-
-    except requests.RequestException as e:
+    except (httpx.HTTPError, etree.LxmlError, ValueError) as e:
+        # LxmlError covers unparseable upstream bodies (e.g. empty
+        # responses), which deserve the same error contract as a failed
+        # fetch rather than a raw 500.
         raise HTTPException(status_code=500, detail=f"Failed to fetch website: {str(e)}")
+
+    return HTMLResponse(
+        content=html,
+        headers={
+            "X-Frame-Options": "SAMEORIGIN",
+            "Content-Security-Policy": "frame-ancestors 'self'",
+            "ETag": etag,
+            "Cache-Control": "private, max-age=60"
+        }
+    )
@@ -1,11 +1,14 @@
 from pathlib import Path
 
+import httpx
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 
 from app.api import router
+from app.api.routes import start_enhancement_workers
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -24,6 +27,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large responses (mainly the proxied preview HTML)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # Mount static files
 if (BASE_DIR / "static").exists():
     app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
@@ -32,6 +38,24 @@ if (BASE_DIR / "static").exists():
 app.include_router(router, prefix="/api")
 
 
+@app.on_event("startup")
+async def startup():
+    # Shared async client for proxying preview fetches; HTTP/2 lets
+    # subresource requests through the proxy multiplex one connection.
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        timeout=30,
+        follow_redirects=True,
+        headers={"User-Agent": "Mozilla/5.0 (compatible; AutoCrisp/1.0)"}
+    )
+    start_enhancement_workers()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await app.state.http.aclose()
+
+
 @app.get("/", response_class=HTMLResponse)
 async def root():
     template_path = BASE_DIR / "templates" / "index.html"
@@ -1,4 +1,5 @@
 from .enhancer import ImageEnhancer
+from .enhancement_cache import EnhancementCache
 from .optimizer import ImageOptimizer
 
-__all__ = ["ImageEnhancer", "ImageOptimizer"]
+__all__ = ["ImageEnhancer", "EnhancementCache", "ImageOptimizer"]
@@ -0,0 +1,80 @@
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional
+
+from app.config import OUTPUT_DIR
+
+
+class EnhancementCache:
+    """
+    Persistent (url, scale) -> enhanced-output mapping.
+
+    Enhancement is the expensive step of the pipeline - an API call billed
+    per image - and the input URL plus scale uniquely identify the result,
+    so repeat runs over the same site can skip it entirely. SQLite keeps
+    the mapping across restarts; rows whose output file has since been
+    deleted are treated as misses and dropped.
+    """
+
+    def __init__(self, db_path: Path = OUTPUT_DIR / ".enhancement_cache.sqlite"):
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._lock = threading.RLock()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS enhancements ("
+            "  key TEXT PRIMARY KEY,"
+            "  original_url TEXT NOT NULL,"
+            "  scale INTEGER NOT NULL,"
+            "  output_path TEXT NOT NULL"
+            ")"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _key(url: str, scale: int) -> str:
+        return hashlib.blake2b(f"{scale}|{url}".encode(), digest_size=8).hexdigest()
+
+    def get(self, url: str, scale: int) -> Optional[Path]:
+        """Return the cached enhanced output for a URL, or None on a miss."""
+        key = self._key(url, scale)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT output_path FROM enhancements WHERE key = ?", (key,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        path = Path(row[0])
+        if not path.exists():
+            # Output was cleared out from under the cache; drop the row.
+            with self._lock:
+                self._conn.execute("DELETE FROM enhancements WHERE key = ?", (key,))
+                self._conn.commit()
+            return None
+
+        return path
+
+    def put(self, url: str, scale: int, output_path: Path):
+        """Record the enhanced output for a URL."""
+        with self._lock:
+            # The output filename is derived from the URL alone, so a new
+            # scale overwrites the same file on disk. Drop this URL's rows
+            # for other scales, or they would keep serving the new pixels
+            # as hits for the old scale.
+            self._conn.execute(
+                "DELETE FROM enhancements WHERE original_url = ? AND scale != ?",
+                (url, scale)
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO enhancements VALUES (?, ?, ?, ?)",
+                (self._key(url, scale), url, scale, str(output_path))
+            )
+            self._conn.commit()
+
+    def clear(self):
+        """Drop all cached entries (outputs have been deleted)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM enhancements")
+            self._conn.commit()
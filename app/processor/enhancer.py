@@ -1,10 +1,17 @@
+import asyncio
 import base64
+import functools
+import random
+import re
+import tempfile
 import time
 from io import BytesIO
 from pathlib import Path
-from typing import Optional
+from typing import BinaryIO
 
+import httpx
 import requests
+from requests.adapters import HTTPAdapter, Retry
 from PIL import Image
 
 from app.config import (
@@ -14,6 +21,92 @@ from app.config import (
 
 MAX_PIXELS = 2000000  # ~2 million pixels max for Real-ESRGAN
 
+# Shared session so result downloads reuse pooled keep-alive connections
+# instead of doing a fresh TCP+TLS handshake per image.
+_SESSION = requests.Session()
+_SESSION.headers.update({"User-Agent": "AutoCrisp/1.0"})
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504])
+))
+
+# Async counterpart for the event-loop enhancement path.
+_ASYNC_SESSION = httpx.AsyncClient(timeout=60, headers={"User-Agent": "AutoCrisp/1.0"})
+
+REPLICATE_MAX_ATTEMPTS = 5
+_MAX_BACKOFF = 30.0
+_TRANSIENT_STATUSES = {429, 500, 502, 503, 504}
+# Word-bounded so a pixel count or URL that merely contains "500" in the
+# message doesn't read as a rate limit.
+_TRANSIENT_CODE_RE = re.compile(r'\b(429|50[0234])\b')
+
+
+def _retry_delay(exc: Exception, attempt: int) -> float:
+    """
+    Seconds to wait before retrying a transient Replicate failure, or a
+    negative value if the error is not retryable.
+
+    Honors a Retry-After header when the SDK exposes the response;
+    otherwise backs off exponentially (1, 2, 4, 8s) with +/-25% jitter so
+    parallel workers don't re-hit the API in lockstep.
+    """
+    status = getattr(getattr(exc, 'response', None), 'status_code', None)
+
+    if isinstance(exc, (TimeoutError, requests.Timeout, httpx.TimeoutException)):
+        transient = True
+    elif status is not None:
+        # A real status code beats any message sniffing.
+        transient = status in _TRANSIENT_STATUSES
+    else:
+        message = str(exc)
+        transient = (
+            'timed out' in message.lower()
+            or _TRANSIENT_CODE_RE.search(message) is not None
+        )
+    if not transient:
+        return -1.0
+
+    response = getattr(exc, 'response', None)
+    if response is not None:
+        retry_after = getattr(response, 'headers', {}).get('Retry-After')
+        if retry_after:
+            try:
+                return min(float(retry_after), _MAX_BACKOFF)
+            except ValueError:
+                pass
+
+    return min(2 ** attempt, _MAX_BACKOFF) * random.uniform(0.75, 1.25)
+
+
+@functools.lru_cache(maxsize=16)
+def _downscaled_bytes(path_str: str, mtime_ns: int, suffix: str) -> bytes:
+    """
+    Downscale an image to the Real-ESRGAN pixel budget, cached per
+    (path, mtime). Only oversized images reach this function, so the
+    cache holds at most 16 already-shrunk payloads; within-budget files
+    are read straight from disk by the caller and never pinned here.
+    `suffix` only selects the output format but keeps the cache key
+    honest if a file is replaced with a different extension.
+    """
+    image_path = Path(path_str)
+
+    with Image.open(image_path) as img:
+        width, height = img.size
+        ratio = (MAX_PIXELS / (width * height)) ** 0.5
+        target = (int(width * ratio), int(height * ratio))
+        # For JPEGs, let libjpeg decode at a reduced DCT scale so
+        # most of the full-resolution decode is skipped entirely.
+        img.draft('RGB', target)
+        # thumbnail() box-reduces close to the target first and only
+        # runs the LANCZOS kernel on the final factor - much cheaper
+        # than LANCZOS over the full-resolution buffer.
+        img.thumbnail(target, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+        buffer = BytesIO()
+        img.save(buffer, format='PNG' if suffix == '.png' else 'JPEG')
+        return buffer.getvalue()
+
 
 class ImageEnhancer:
     """Enhances images using OpenAI or Replicate API."""
@@ -32,7 +125,7 @@ class ImageEnhancer:
             import replicate
             self.client = replicate.Client(api_token=REPLICATE_API_TOKEN)
 
-    def _prepare_image_for_openai(self, image_path: Path) -> bytes:
+    def _prepare_image_for_openai(self, image_path: Path) -> BytesIO:
         """Prepare image for OpenAI API (must be PNG, max 4MB, square for best results)."""
         with Image.open(image_path) as img:
             # Convert to RGB if needed (remove alpha)
@@ -42,98 +135,147 @@ class ImageEnhancer:
             # Resize if too large (OpenAI has 4MB limit)
             max_size = 1024
             if img.width > max_size or img.height > max_size:
-                img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+                # DCT-scaled decode for JPEGs, then box-reduce before the
+                # final LANCZOS pass - same fast path as _downscaled_bytes.
+                img.draft('RGB', (max_size, max_size))
+                img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS, reducing_gap=3.0)
 
-            # Save as PNG
+            # Save as PNG and hand the buffer itself over - getvalue() would
+            # copy the whole encoded image just to wrap it again upstream
             buffer = BytesIO()
             img.save(buffer, format='PNG')
-            return buffer.getvalue()
+            buffer.seek(0)
+            buffer.name = "image.png"
+            return buffer
 
-    def _resize_if_needed(self, image_path: Path) -> bytes:
+    def _resize_if_needed(self, image_path: Path) -> BytesIO:
         """Resize image if it exceeds max pixel count (for Replicate)."""
+        # Reading .size only parses the header. Within-budget files are
+        # uploaded as-is and read from disk each time - caching them would
+        # spend the most memory on entries that save no decode/encode work.
+        # Oversized ones reuse the downscale from the first run, keyed by
+        # mtime so enhancing the same source at multiple scales (common
+        # UX) hits the cache.
         with Image.open(image_path) as img:
             width, height = img.size
-            pixels = width * height
-
-            if pixels > MAX_PIXELS:
-                ratio = (MAX_PIXELS / pixels) ** 0.5
-                new_width = int(width * ratio)
-                new_height = int(height * ratio)
-                img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
 
-            buffer = BytesIO()
-            img_format = 'PNG' if image_path.suffix.lower() == '.png' else 'JPEG'
-            img.save(buffer, format=img_format)
-            return buffer.getvalue()
+        if width * height <= MAX_PIXELS:
+            buffer = BytesIO(image_path.read_bytes())
+        else:
+            stat = image_path.stat()
+            buffer = BytesIO(_downscaled_bytes(str(image_path), stat.st_mtime_ns, image_path.suffix.lower()))
+        # The SDK derives the upload's filename and content type from
+        # .name; without it the file lands as application/octet-stream
+        buffer.name = image_path.name
+        return buffer
 
-    def enhance_with_openai(self, image_path: Path) -> bytes:
+    def enhance_with_openai(self, image_path: Path) -> BinaryIO:
         """Enhance image using OpenAI's DALL-E 2 variation API."""
-        # Read and prepare image
-        image_data = self._prepare_image_for_openai(image_path)
-
-        # Save to a temporary file with proper extension for OpenAI
-        import tempfile
-        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
-            tmp.write(image_data)
-            tmp_path = tmp.name
-
-        try:
-            # Open file for OpenAI API - use create_variation for enhancement
-            with open(tmp_path, 'rb') as img_file:
-                response = self.client.images.create_variation(
-                    model="dall-e-2",
-                    image=img_file,
-                    n=1,
-                    size="1024x1024"
-                )
-        finally:
-            # Clean up temp file
-            import os
-            os.unlink(tmp_path)
+        # Prepare the image; the SDK accepts any named file-like object
+        buf = self._prepare_image_for_openai(image_path)
+
+        response = self.client.images.create_variation(
+            model="dall-e-2",
+            image=buf,
+            n=1,
+            size="1024x1024"
+        )
 
         # Get the result URL and download
         image_url = response.data[0].url
         if image_url:
-            img_response = requests.get(image_url, timeout=60)
+            img_response = _SESSION.get(image_url, timeout=60)
             img_response.raise_for_status()
-            return img_response.content
+            return BytesIO(img_response.content)
         elif response.data[0].b64_json:
-            return base64.b64decode(response.data[0].b64_json)
+            return BytesIO(base64.b64decode(response.data[0].b64_json))
         else:
             raise ValueError("No image returned from OpenAI")
 
-    def enhance_with_replicate(self, image_path: Path, scale: int = UPSCALE_FACTOR) -> bytes:
+    def enhance_with_replicate(self, image_path: Path, scale: int = UPSCALE_FACTOR) -> BinaryIO:
         """Enhance image using Replicate's Real-ESRGAN."""
-        image_data = self._resize_if_needed(image_path)
-        img_format = 'png' if image_path.suffix.lower() == '.png' else 'jpeg'
+        # Since replicate 0.31 the SDK pushes file-like inputs through the
+        # Files API (a multipart upload that yields a URL), so the raw bytes
+        # go over the wire once. Older SDKs base64-inflated them into a
+        # data: URI and held both copies in memory - hence the pin.
+        image_buffer = self._resize_if_needed(image_path)
 
-        for attempt in range(3):
+        for attempt in range(REPLICATE_MAX_ATTEMPTS):
             try:
+                image_buffer.seek(0)
                 output = self.client.run(
                     ESRGAN_MODEL,
                     input={
-                        "image": f"data:image/{img_format};base64,{base64.b64encode(image_data).decode()}",
+                        "image": image_buffer,
+                        "scale": scale,
+                        "face_enhance": False
+                    }
+                )
+                break
+            except Exception as e:
+                delay = _retry_delay(e, attempt)
+                if delay < 0 or attempt == REPLICATE_MAX_ATTEMPTS - 1:
+                    raise
+                time.sleep(delay)
+
+        if isinstance(output, str):
+            # Stream the download instead of materializing the full enhanced
+            # image (tens of MB for 4x upscales) as one bytes object. Small
+            # results stay in memory; large ones spill to disk.
+            spooled = tempfile.SpooledTemporaryFile(max_size=8 << 20)
+            with _SESSION.get(output, timeout=60, stream=True) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=1 << 20):
+                    spooled.write(chunk)
+            spooled.seek(0)
+            return spooled
+        elif hasattr(output, 'read'):
+            return output
+        else:
+            raise ValueError(f"Unexpected output type from Replicate: {type(output)}")
+
+    async def enhance_with_replicate_async(self, image_path: Path, scale: int = UPSCALE_FACTOR) -> BinaryIO:
+        """
+        Async variant of enhance_with_replicate.
+
+        Upload, polling and download all await cooperatively, so concurrent
+        jobs overlap their network waits inside one event loop instead of
+        serializing upload -> poll -> download per worker thread.
+        """
+        image_buffer = await asyncio.to_thread(self._resize_if_needed, image_path)
+
+        for attempt in range(REPLICATE_MAX_ATTEMPTS):
+            try:
+                image_buffer.seek(0)
+                output = await self.client.async_run(
+                    ESRGAN_MODEL,
+                    input={
+                        "image": image_buffer,
                         "scale": scale,
                         "face_enhance": False
                     }
                 )
                 break
             except Exception as e:
-                if '429' in str(e) and attempt < 2:
-                    time.sleep(10)
-                    continue
-                raise
+                delay = _retry_delay(e, attempt)
+                if delay < 0 or attempt == REPLICATE_MAX_ATTEMPTS - 1:
+                    raise
+                await asyncio.sleep(delay)
 
         if isinstance(output, str):
-            response = requests.get(output, timeout=60)
-            response.raise_for_status()
-            return response.content
+            spooled = tempfile.SpooledTemporaryFile(max_size=8 << 20)
+            async with _ASYNC_SESSION.stream("GET", output) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes(1 << 20):
+                    spooled.write(chunk)
+            spooled.seek(0)
+            return spooled
         elif hasattr(output, 'read'):
-            return output.read()
+            return output
         else:
             raise ValueError(f"Unexpected output type from Replicate: {type(output)}")
 
-    def enhance(self, image_path: Path, scale: int = UPSCALE_FACTOR) -> bytes:
+    def enhance(self, image_path: Path, scale: int = UPSCALE_FACTOR) -> BinaryIO:
         """
         Enhance an image using the configured provider.
 
@@ -142,7 +284,7 @@ class ImageEnhancer:
             scale: Upscale factor (only used for Replicate)
 
         Returns:
-            Enhanced image as bytes
+            Enhanced image as a readable binary stream
         """
         if not image_path.exists():
             raise FileNotFoundError(f"Image not found: {image_path}")
@@ -152,18 +294,17 @@ class ImageEnhancer:
         else:
             return self.enhance_with_replicate(image_path, scale)
 
-    def enhance_to_file(self, image_path: Path, output_path: Path, scale: int = UPSCALE_FACTOR) -> Path:
+    async def enhance_async(self, image_path: Path, scale: int = UPSCALE_FACTOR) -> BinaryIO:
         """
-        Enhance an image and save to a file.
-
-        Args:
-            image_path: Path to the input image
-            output_path: Path to save the enhanced image
-            scale: Upscale factor (only used for Replicate)
+        Async counterpart of enhance() for use on the event loop.
 
-        Returns:
-            Path to the enhanced image
+        The OpenAI provider has no async client here, so it runs the sync
+        path in a thread.
         """
-        enhanced_data = self.enhance(image_path, scale)
-        output_path.write_bytes(enhanced_data)
-        return output_path
+        if not image_path.exists():
+            raise FileNotFoundError(f"Image not found: {image_path}")
+
+        if self.provider == "openai":
+            return await asyncio.to_thread(self.enhance_with_openai, image_path)
+        else:
+            return await self.enhance_with_replicate_async(image_path, scale)
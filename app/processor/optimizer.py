@@ -1,11 +1,22 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
 from pathlib import Path
 from dataclasses import dataclass
-from typing import Optional, Tuple
+from typing import BinaryIO, Iterable, List, Optional, Tuple
 
 from PIL import Image
 
 from app.config import OUTPUT_DIR, OUTPUT_FORMAT, OUTPUT_QUALITY
 
+# Optional: libvips streams images through fused load+resize+encode regions
+# instead of materializing full pixel buffers per stage. Used when installed;
+# Pillow remains the baseline and the fallback for formats vips can't load.
+try:
+    import pyvips
+except ImportError:
+    pyvips = None
+
 
 @dataclass
 class OptimizationResult:
@@ -32,11 +43,37 @@ class ImageOptimizer:
         self,
         output_format: str = OUTPUT_FORMAT,
         quality: int = OUTPUT_QUALITY,
-        max_dimension: Optional[int] = None
+        max_dimension: Optional[int] = None,
+        webp_method: int = 4,
+        progressive: bool = True,
+        optimize: bool = False
     ):
         self.output_format = output_format.lower()
         self.quality = quality
         self.max_dimension = max_dimension
+        # libwebp effort level 0-6. Method 6 is 3-5x slower than 4 for a
+        # negligible size win, so default to 4 and let callers opt in to
+        # max compression.
+        self.webp_method = webp_method
+        self.progressive = progressive
+        # optimize=True runs libjpeg's two-pass Huffman optimization, which
+        # costs a second full encode pass for single-digit-percent savings.
+        # Off by default; callers chasing bytes over throughput can enable it.
+        self.optimize = optimize
+
+    def _save_kwargs(self) -> dict:
+        """Encoder settings for the configured output format."""
+        kwargs = {"quality": self.quality, "optimize": self.optimize}
+
+        if self.output_format == "webp":
+            kwargs["method"] = self.webp_method
+        elif self.output_format in ("jpg", "jpeg"):
+            kwargs["progressive"] = self.progressive
+            # 4:2:0 chroma subsampling - halves chroma bandwidth, standard
+            # for web delivery.
+            kwargs["subsampling"] = 2
+
+        return kwargs
 
     def optimize(self, image_path: Path, output_name: Optional[str] = None) -> OptimizationResult:
         """
@@ -65,7 +102,11 @@ class ImageOptimizer:
 
             # Resize if max dimension is set
             if self.max_dimension:
-                img.thumbnail((self.max_dimension, self.max_dimension), Image.Resampling.LANCZOS)
+                img.thumbnail(
+                    (self.max_dimension, self.max_dimension),
+                    Image.Resampling.LANCZOS,
+                    reducing_gap=3.0
+                )
 
             optimized_dimensions = img.size
 
@@ -74,15 +115,7 @@ class ImageOptimizer:
             ext = "jpg" if self.output_format == "jpeg" else self.output_format
             output_path = OUTPUT_DIR / f"{name}.{ext}"
 
-            # Save with optimization
-            save_kwargs = {"quality": self.quality, "optimize": True}
-
-            if self.output_format == "webp":
-                save_kwargs["method"] = 6  # Best compression
-            elif self.output_format in ("jpg", "jpeg"):
-                save_kwargs["progressive"] = True
-
-            img.save(output_path, **save_kwargs)
+            img.save(output_path, **self._save_kwargs())
 
         optimized_size = output_path.stat().st_size
 
@@ -95,6 +128,23 @@ class ImageOptimizer:
             optimized_dimensions=optimized_dimensions
         )
 
+    def optimize_many(self, paths: Iterable[Path]) -> List[OptimizationResult]:
+        """
+        Optimize a batch of images in parallel, one process per core.
+
+        Encoding is CPU-bound in libjpeg/libwebp, so a process pool scales
+        near-linearly with cores and keeps encode work out of the server
+        process entirely. The optimizer and its results pickle cleanly.
+
+        Args:
+            paths: Paths of images to optimize
+
+        Returns:
+            OptimizationResults in the same order as the input paths
+        """
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as pool:
+            return list(pool.map(self.optimize, paths))
+
     def optimize_bytes(self, image_data: bytes, output_name: str) -> OptimizationResult:
         """
         Optimize image from bytes.
@@ -106,11 +156,33 @@ class ImageOptimizer:
         Returns:
             OptimizationResult with before/after stats
         """
-        from io import BytesIO
+        return self.optimize_stream(BytesIO(image_data), output_name)
+
+    def optimize_stream(self, fileobj: BinaryIO, output_name: str) -> OptimizationResult:
+        """
+        Optimize image from a readable binary stream.
+
+        PIL reads directly from the stream, so the full image bytes are
+        never materialized as a Python string.
+
+        Args:
+            fileobj: Seekable binary stream positioned at the image start
+            output_name: Output filename (without extension)
+
+        Returns:
+            OptimizationResult with before/after stats
+        """
+        fileobj.seek(0, 2)
+        original_size = fileobj.tell()
+        fileobj.seek(0)
 
-        original_size = len(image_data)
+        if pyvips is not None and self.output_format in ("webp", "jpg", "jpeg"):
+            try:
+                return self._optimize_stream_vips(fileobj, output_name, original_size)
+            except pyvips.Error:
+                fileobj.seek(0)
 
-        with Image.open(BytesIO(image_data)) as img:
+        with Image.open(fileobj) as img:
             original_dimensions = img.size
 
             # Convert to RGB if necessary
@@ -121,7 +193,11 @@ class ImageOptimizer:
 
             # Resize if max dimension is set
             if self.max_dimension:
-                img.thumbnail((self.max_dimension, self.max_dimension), Image.Resampling.LANCZOS)
+                img.thumbnail(
+                    (self.max_dimension, self.max_dimension),
+                    Image.Resampling.LANCZOS,
+                    reducing_gap=3.0
+                )
 
             optimized_dimensions = img.size
 
@@ -129,15 +205,47 @@ class ImageOptimizer:
             ext = "jpg" if self.output_format == "jpeg" else self.output_format
             output_path = OUTPUT_DIR / f"{output_name}.{ext}"
 
-            # Save with optimization
-            save_kwargs = {"quality": self.quality, "optimize": True}
+            img.save(output_path, **self._save_kwargs())
+
+        optimized_size = output_path.stat().st_size
 
-            if self.output_format == "webp":
-                save_kwargs["method"] = 6
-            elif self.output_format in ("jpg", "jpeg"):
-                save_kwargs["progressive"] = True
+        return OptimizationResult(
+            input_path=output_path,  # No original path for bytes input
+            output_path=output_path,
+            original_size=original_size,
+            optimized_size=optimized_size,
+            original_dimensions=original_dimensions,
+            optimized_dimensions=optimized_dimensions
+        )
 
-            img.save(output_path, **save_kwargs)
+    def _optimize_stream_vips(
+        self,
+        fileobj: BinaryIO,
+        output_name: str,
+        original_size: int
+    ) -> OptimizationResult:
+        """libvips variant of optimize_stream: load, resize and encode fused."""
+        data = fileobj.read()
+
+        # new_from_buffer only parses the header until pixels are demanded,
+        # so reading the original dimensions here is cheap.
+        probe = pyvips.Image.new_from_buffer(data, "")
+        original_dimensions = (probe.width, probe.height)
+
+        # thumbnail_buffer fuses decode and resample into one streaming
+        # pass; size="down" never upscales, matching thumbnail() semantics.
+        target = self.max_dimension or max(original_dimensions)
+        img = pyvips.Image.thumbnail_buffer(data, target, height=target, size="down")
+        optimized_dimensions = (img.width, img.height)
+
+        ext = "jpg" if self.output_format == "jpeg" else self.output_format
+        output_path = OUTPUT_DIR / f"{output_name}.{ext}"
+
+        if self.output_format == "webp":
+            options = f".webp[Q={self.quality},effort={self.webp_method}]"
+        else:
+            options = f".jpg[Q={self.quality}]"
+        output_path.write_bytes(img.write_to_buffer(options))
 
         optimized_size = output_path.stat().st_size
 
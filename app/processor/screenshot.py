@@ -1,12 +1,28 @@
+import asyncio
 import base64
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 from urllib.parse import urlparse
 
+import aiofiles
 from playwright.async_api import async_playwright
 
 from app.config import OUTPUT_DIR
 
+# Data URIs keyed by path with the file's mtime, so the before/after pair
+# (and any retakes) encode each enhanced image exactly once. Entries
+# self-invalidate when the file on disk changes; the count bound keeps the
+# multi-MB encoded payloads from accumulating without limit.
+_DATA_URI_CACHE_MAX = 32
+_DATA_URI_CACHE: "OrderedDict[str, Tuple[int, str]]" = OrderedDict()
+
+
+def clear_data_uri_cache():
+    """Drop all cached data URIs (e.g. after outputs are deleted)."""
+    _DATA_URI_CACHE.clear()
+
 
 class WebsiteScreenshotter:
     """Captures full-page screenshots of websites."""
@@ -20,11 +36,22 @@ class WebsiteScreenshotter:
         parsed = urlparse(url)
         return parsed.netloc.replace(".", "_").replace(":", "_")
 
+    @asynccontextmanager
+    async def _session(self):
+        """Yield a launched browser to share across multiple captures."""
+        async with async_playwright() as p:
+            browser = await p.firefox.launch(headless=True)
+            try:
+                yield browser
+            finally:
+                await browser.close()
+
     async def capture_full_page(
         self,
         url: str,
         output_name: str,
-        image_replacements: Optional[Dict[str, str]] = None
+        image_replacements: Optional[Dict[str, str]] = None,
+        browser=None
     ) -> Path:
         """
         Capture a full-page screenshot of a website.
@@ -33,16 +60,22 @@ class WebsiteScreenshotter:
             url: The website URL to screenshot
             output_name: Name for the output file (without extension)
             image_replacements: Optional dict mapping original image URLs to local enhanced paths
+            browser: Optional already-launched browser to reuse; when omitted,
+                one is launched for this capture only
 
         Returns:
             Path to the saved screenshot
         """
-        output_path = self.screenshots_dir / f"{output_name}.png"
+        if browser is None:
+            async with self._session() as browser:
+                return await self.capture_full_page(
+                    url, output_name, image_replacements, browser=browser
+                )
 
-        async with async_playwright() as p:
-            browser = await p.firefox.launch(headless=True)
-            page = await browser.new_page(viewport={"width": 1920, "height": 1080})
+        output_path = self.screenshots_dir / f"{output_name}.png"
 
+        page = await browser.new_page(viewport={"width": 1920, "height": 1080})
+        try:
             # Navigate to page
             await page.goto(url, wait_until="networkidle", timeout=60000)
 
@@ -63,11 +96,53 @@ class WebsiteScreenshotter:
 
             # Take full page screenshot
             await page.screenshot(path=str(output_path), full_page=True)
-
-            await browser.close()
+        finally:
+            await page.close()
 
         return output_path
 
+    # Single-pass replacement: walk the DOM once against the full lookup
+    # map instead of one evaluate() round-trip (each with its own
+    # querySelectorAll('*') sweep) per replaced image.
+    _INJECT_JS = """
+        (replacements) => {
+            const map = new Map(Object.entries(replacements));
+
+            // Replace img src
+            document.querySelectorAll('img').forEach(img => {
+                const match = map.get(img.src)
+                    || map.get(img.dataset.src)
+                    || map.get(img.dataset.lazySrc);
+                if (match) {
+                    img.src = match;
+                }
+            });
+
+            // Replace srcset
+            document.querySelectorAll('source').forEach(source => {
+                if (!source.srcset) return;
+                for (const [url, dataUri] of map) {
+                    if (source.srcset.includes(url)) {
+                        source.srcset = dataUri;
+                        break;
+                    }
+                }
+            });
+
+            // Replace background images
+            document.querySelectorAll('*').forEach(el => {
+                const bg = window.getComputedStyle(el).backgroundImage;
+                if (bg === 'none') return;
+                for (const [url, dataUri] of map) {
+                    if (bg.includes(url)) {
+                        el.style.backgroundImage = `url(${dataUri})`;
+                        break;
+                    }
+                }
+            });
+        }
+    """
+
     async def _inject_enhanced_images(self, page, replacements: Dict[str, str]):
         """
         Inject enhanced images into the page by replacing src attributes.
@@ -76,50 +151,44 @@ class WebsiteScreenshotter:
             page: Playwright page object
             replacements: Dict mapping original URLs to base64 data URIs or local paths
         """
+        # Build the full url -> data URI map first, then hand it to the
+        # page in one evaluate() call.
+        replacements_data = {}
         for original_url, enhanced_path in replacements.items():
-            # Read enhanced image and convert to base64
-            if Path(enhanced_path).exists():
-                with open(enhanced_path, "rb") as f:
-                    img_data = f.read()
-
-                # Detect format
-                if enhanced_path.endswith(".webp"):
-                    mime = "image/webp"
-                elif enhanced_path.endswith(".png"):
-                    mime = "image/png"
-                else:
-                    mime = "image/jpeg"
-
-                data_uri = f"data:{mime};base64,{base64.b64encode(img_data).decode()}"
-
-                # Replace in page using JavaScript
-                await page.evaluate(f"""
-                    (function() {{
-                        // Replace img src
-                        document.querySelectorAll('img').forEach(img => {{
-                            if (img.src === '{original_url}' ||
-                                img.dataset.src === '{original_url}' ||
-                                img.dataset.lazySrc === '{original_url}') {{
-                                img.src = '{data_uri}';
-                            }}
-                        }});
-
-                        // Replace srcset
-                        document.querySelectorAll('source').forEach(source => {{
-                            if (source.srcset && source.srcset.includes('{original_url}')) {{
-                                source.srcset = '{data_uri}';
-                            }}
-                        }});
-
-                        // Replace background images
-                        document.querySelectorAll('*').forEach(el => {{
-                            const style = window.getComputedStyle(el);
-                            if (style.backgroundImage.includes('{original_url}')) {{
-                                el.style.backgroundImage = 'url({data_uri})';
-                            }}
-                        }});
-                    }})();
-                """)
+            path = Path(enhanced_path)
+            if not path.exists():
+                continue
+
+            mtime_ns = path.stat().st_mtime_ns
+            cached = _DATA_URI_CACHE.get(enhanced_path)
+            if cached is not None and cached[0] == mtime_ns:
+                _DATA_URI_CACHE.move_to_end(enhanced_path)
+                replacements_data[original_url] = cached[1]
+                continue
+
+            # Read enhanced image and convert to base64. Both the read and
+            # the encode happen off the event loop so Playwright's CDP
+            # traffic isn't stalled behind multi-MB upscaled images.
+            async with aiofiles.open(enhanced_path, "rb") as f:
+                img_data = await f.read()
+
+            # Detect format
+            if enhanced_path.endswith(".webp"):
+                mime = "image/webp"
+            elif enhanced_path.endswith(".png"):
+                mime = "image/png"
+            else:
+                mime = "image/jpeg"
+
+            encoded = await asyncio.to_thread(base64.b64encode, img_data)
+            data_uri = f"data:{mime};base64,{encoded.decode()}"
+            _DATA_URI_CACHE[enhanced_path] = (mtime_ns, data_uri)
+            if len(_DATA_URI_CACHE) > _DATA_URI_CACHE_MAX:
+                _DATA_URI_CACHE.popitem(last=False)
+            replacements_data[original_url] = data_uri
+
+        if replacements_data:
+            await page.evaluate(self._INJECT_JS, replacements_data)
 
     async def capture_before_after(
         self,
@@ -138,19 +207,24 @@ class WebsiteScreenshotter:
         """
         site_id = self._get_site_id(url)
 
-        # Capture before (original)
-        before_path = await self.capture_full_page(
-            url,
-            f"{site_id}_before",
-            image_replacements=None
-        )
-
-        # Capture after (with enhanced images)
-        after_path = await self.capture_full_page(
-            url,
-            f"{site_id}_after",
-            image_replacements=image_replacements
-        )
+        # One Firefox launch for both captures - cold-starting the browser
+        # costs more than either screenshot.
+        async with self._session() as browser:
+            # Capture before (original)
+            before_path = await self.capture_full_page(
+                url,
+                f"{site_id}_before",
+                image_replacements=None,
+                browser=browser
+            )
+
+            # Capture after (with enhanced images)
+            after_path = await self.capture_full_page(
+                url,
+                f"{site_id}_after",
+                image_replacements=image_replacements,
+                browser=browser
+            )
 
         return {
             "before": before_path,
@@ -1,16 +1,33 @@
 import re
 import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from urllib.parse import urljoin, urlparse
 from dataclasses import dataclass, field
 from typing import Optional, List
 
+import imagesize
+import lxml.html
 import requests
-from bs4 import BeautifulSoup
+from cachecontrol import CacheControlAdapter
+from cachecontrol.caches.file_cache import FileCache
+from lxml import etree
 from PIL import Image
 
 from app.config import TEMP_DIR
 
+# Compiled once; XPath evaluation stays in C with no per-element wrapping
+# overhead the way BeautifulSoup's find_all walks had.
+_IMG_XPATH = etree.XPath(".//img")
+_SOURCE_XPATH = etree.XPath(".//source[@srcset]")
+_STYLE_ATTR_XPATH = etree.XPath("//@style")
+_STYLE_TAG_XPATH = etree.XPath(".//style/text()")
+
+_BG_URL_RE = re.compile(r'background(?:-image)?\s*:\s*url\(["\']?([^"\')\s]+)["\']?\)')
+
+# First token of each srcset candidate ("url 2x, url 640w" -> urls)
+_SRCSET_URL_RE = re.compile(r'([^\s,]+)(?:\s+[^,]*)?')
+
 
 @dataclass
 class ImageInfo:
@@ -29,6 +46,7 @@ class WebScraper:
     """Scrapes images from a website."""
 
     SUPPORTED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp"}
+    DOWNLOAD_WORKERS = 16
 
     def __init__(self, base_url: str):
         self.base_url = base_url
@@ -36,19 +54,34 @@ class WebScraper:
         self.session.headers.update({
             "User-Agent": "Mozilla/5.0 (compatible; ImageEnhancerBot/1.0)"
         })
+        # Pool sized to the download workers so parallel downloads reuse
+        # keep-alive connections instead of re-handshaking per image. The
+        # cachecontrol adapter layers ETag/Last-Modified revalidation on
+        # top, so repeat scans of an unchanged site 304 instead of
+        # re-downloading the same bytes.
+        cache = FileCache(str(TEMP_DIR / ".web_cache"))
+        for scheme in ("http://", "https://"):
+            self.session.mount(scheme, CacheControlAdapter(
+                cache=cache,
+                pool_connections=self.DOWNLOAD_WORKERS,
+                pool_maxsize=self.DOWNLOAD_WORKERS
+            ))
         self.images: List[ImageInfo] = []
 
     def _generate_id(self, url: str) -> str:
         """Generate a unique ID for an image URL."""
-        return hashlib.md5(url.encode()).hexdigest()[:12]
+        # blake2b emits exactly the 12 hex chars we need - no cryptographic
+        # MD5 setup cost and no sliced-away digest. Matches the scan-id
+        # scheme in the API layer.
+        return hashlib.blake2b(url.encode(), digest_size=6).hexdigest()
 
     def _is_valid_image_url(self, url: str) -> bool:
         """Check if URL points to a supported image format."""
         parsed = urlparse(url)
-        path = parsed.path.lower()
 
-        # Check for standard extensions
-        if any(path.endswith(ext) for ext in self.SUPPORTED_EXTENSIONS):
+        # Check for standard extensions - one set lookup instead of six
+        # endswith scans per URL
+        if Path(parsed.path).suffix.lower() in self.SUPPORTED_EXTENSIONS:
             return True
 
         # Check for known image CDNs that don't use extensions
@@ -67,23 +100,15 @@ class WebScraper:
         """Convert relative URL to absolute."""
         return urljoin(self.base_url, url)
 
-    def _extract_background_images(self, soup: BeautifulSoup) -> List[str]:
-        """Extract background-image URLs from inline styles."""
-        urls = []
-        pattern = re.compile(r'background(?:-image)?\s*:\s*url\(["\']?([^"\')\s]+)["\']?\)')
-
-        for element in soup.find_all(style=True):
-            style = element.get("style", "")
-            matches = pattern.findall(style)
-            urls.extend(matches)
+    def _extract_background_images(self, tree) -> List[str]:
+        """Extract background-image URLs from inline styles and <style> tags."""
+        # //@style yields the attribute strings directly; joining them (and
+        # the <style> bodies) lets the precompiled regex scan one string per
+        # source instead of looping match state per element.
+        styles = "\n".join(_STYLE_ATTR_XPATH(tree))
+        css = "\n".join(_STYLE_TAG_XPATH(tree))
 
-        # Also check <style> tags
-        for style_tag in soup.find_all("style"):
-            if style_tag.string:
-                matches = pattern.findall(style_tag.string)
-                urls.extend(matches)
-
-        return urls
+        return _BG_URL_RE.findall(styles) + _BG_URL_RE.findall(css)
 
     def scan(self) -> List[ImageInfo]:
         """Scan the website for all images."""
@@ -93,11 +118,14 @@ class WebScraper:
         except requests.RequestException as e:
             raise Exception(f"Failed to fetch {self.base_url}: {e}")
 
-        soup = BeautifulSoup(response.text, "lxml")
+        # Parse the raw bytes with lxml directly - it honours the declared
+        # encoding and skips both BeautifulSoup's Python wrapping layer and
+        # the Unicode re-encode of the body.
+        tree = lxml.html.fromstring(response.content)
         seen_urls = set()
 
         # Find <img> tags
-        for img in soup.find_all("img"):
+        for img in _IMG_XPATH(tree):
             src = img.get("src") or img.get("data-src") or img.get("data-lazy-src")
             if not src:
                 continue
@@ -110,29 +138,28 @@ class WebScraper:
             self.images.append(ImageInfo(
                 id=self._generate_id(url),
                 original_url=url,
-                alt_text=img.get("alt", ""),
+                alt_text=img.get("alt") or "",
                 source_element="img"
             ))
 
         # Find <source> in <picture> elements
-        for source in soup.find_all("source"):
-            srcset = source.get("srcset", "")
-            # Parse srcset (may contain multiple URLs with sizes)
-            for part in srcset.split(","):
-                url_part = part.strip().split()[0] if part.strip() else ""
-                if url_part:
-                    url = self._resolve_url(url_part)
-                    if url in seen_urls or not self._is_valid_image_url(url):
-                        continue
-                    seen_urls.add(url)
-                    self.images.append(ImageInfo(
-                        id=self._generate_id(url),
-                        original_url=url,
-                        source_element="source"
-                    ))
+        for source in _SOURCE_XPATH(tree):
+            srcset = source.get("srcset") or ""
+            # Each candidate's URL in one pass, without the split/strip/split
+            # temporaries per candidate
+            for match in _SRCSET_URL_RE.finditer(srcset):
+                url = self._resolve_url(match.group(1))
+                if url in seen_urls or not self._is_valid_image_url(url):
+                    continue
+                seen_urls.add(url)
+                self.images.append(ImageInfo(
+                    id=self._generate_id(url),
+                    original_url=url,
+                    source_element="source"
+                ))
 
         # Find background images
-        for bg_url in self._extract_background_images(soup):
+        for bg_url in self._extract_background_images(tree):
             url = self._resolve_url(bg_url)
             if url in seen_urls or not self._is_valid_image_url(url):
                 continue
@@ -146,51 +173,71 @@ class WebScraper:
         return self.images
 
     def download_image(self, image: ImageInfo) -> ImageInfo:
-        """Download a single image to temp directory."""
+        """Download a single image to temp directory, streaming to disk."""
         try:
-            response = self.session.get(image.original_url, timeout=30)
-            response.raise_for_status()
+            with self.session.get(image.original_url, stream=True, timeout=30) as response:
+                response.raise_for_status()
+
+                # Determine file extension from URL, content-type, or default
+                parsed = urlparse(image.original_url)
+                ext = Path(parsed.path).suffix.lower()
+
+                if not ext or ext not in self.SUPPORTED_EXTENSIONS:
+                    # Try to get from content-type header
+                    content_type = response.headers.get('content-type', '').lower()
+                    if 'png' in content_type:
+                        ext = '.png'
+                    elif 'gif' in content_type:
+                        ext = '.gif'
+                    elif 'webp' in content_type:
+                        ext = '.webp'
+                    else:
+                        ext = '.jpg'  # Default to jpg
+
+                local_path = TEMP_DIR / f"{image.id}{ext}"
+
+                # Stream to disk in 64 KB chunks so the body is never fully
+                # buffered in memory.
+                with open(local_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        f.write(chunk)
         except requests.RequestException as e:
             raise Exception(f"Failed to download {image.original_url}: {e}")
 
-        # Determine file extension from URL, content-type, or default
-        parsed = urlparse(image.original_url)
-        ext = Path(parsed.path).suffix.lower()
-
-        if not ext or ext not in self.SUPPORTED_EXTENSIONS:
-            # Try to get from content-type header
-            content_type = response.headers.get('content-type', '').lower()
-            if 'png' in content_type:
-                ext = '.png'
-            elif 'gif' in content_type:
-                ext = '.gif'
-            elif 'webp' in content_type:
-                ext = '.webp'
-            else:
-                ext = '.jpg'  # Default to jpg
-
-        # Save to temp directory
-        local_path = TEMP_DIR / f"{image.id}{ext}"
-        local_path.write_bytes(response.content)
-
-        # Get image dimensions
+        # imagesize reads just the magic bytes and header - no decoder
+        # setup, no partial decode. It reports (-1, -1) rather than raising
+        # for formats it can't parse (e.g. BMP), so Pillow covers both the
+        # sentinel and the error case.
         try:
-            with Image.open(local_path) as img:
-                image.width, image.height = img.size
+            width, height = imagesize.get(str(local_path))
         except Exception:
-            pass
+            width = height = -1
+
+        if width > 0 and height > 0:
+            image.width, image.height = width, height
+        else:
+            try:
+                with Image.open(local_path) as img:
+                    image.width, image.height = img.size
+            except Exception:
+                pass
 
         image.local_path = local_path
-        image.file_size = len(response.content)
+        image.file_size = local_path.stat().st_size
 
         return image
 
     def download_all(self) -> List[ImageInfo]:
-        """Download all discovered images."""
-        for image in self.images:
+        """Download all discovered images in parallel."""
+        def _download(image: ImageInfo):
             try:
                 self.download_image(image)
             except Exception as e:
                 print(f"Warning: Failed to download {image.original_url}: {e}")
 
+        # Downloads are I/O-bound, so total time is dominated by RTT x N when
+        # done serially; a thread pool brings it close to the slowest image.
+        with ThreadPoolExecutor(max_workers=self.DOWNLOAD_WORKERS) as pool:
+            list(pool.map(_download, self.images))
+
         return [img for img in self.images if img.local_path is not None]